@@ -0,0 +1,166 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, process_time
+
+import main_process
+from main_process import BATCH_LIMIT, DivisorCache, factorize, factorize_batch, factorize_many, factorize_one
+
+"""
+--sizes [-n] default = 1000 10000 100000
+--distributions [-d] default = all
+--engines [-e] default = all
+--repeat [-r] default = 3
+--json, --csv report files
+"""
+
+REFERENCE = {
+    128: [1, 2, 4, 8, 16, 32, 64, 128],
+    255: [1, 3, 5, 15, 17, 51, 85, 255],
+    99999: [1, 3, 9, 41, 123, 271, 369, 813, 2439, 11111, 33333, 99999],
+    10651060: [1, 2, 4, 5, 7, 10, 14, 20, 28, 35, 70, 140, 76079, 152158, 304316, 380395, 532553, 760790,
+               1065106, 1521580, 2130212, 2662765, 5325530, 10651060],
+}
+
+DISTRIBUTIONS = {
+    "small": lambda rnd, n: [rnd.randrange(1, 10 ** 4) for _ in range(n)],
+    "medium": lambda rnd, n: [rnd.randrange(1, 10 ** 7) for _ in range(n)],
+    "large": lambda rnd, n: [rnd.randrange(10 ** 9, 10 ** 12) for _ in range(n)],
+    "mixed": lambda rnd, n: [rnd.randrange(1, 10 ** rnd.randint(2, 12)) for _ in range(n)],
+    # багато повторів: тут видно роботу дедуплікації в factorize_many
+    "repeated": lambda rnd, n: [rnd.randrange(1, 10 ** 7) for _ in range(max(1, n // 100))] * 100,
+}
+
+
+def threaded(*number):
+    # GIL не дає потокам рахувати паралельно; цей варіант — для порівняння
+    with ThreadPoolExecutor(os.cpu_count()) as pool:
+        return list(pool.map(factorize_one, number))
+
+
+ENGINES = {
+    "sequential": factorize,
+    "threaded": threaded,
+    "process": factorize_many,
+    "vectorized": lambda *number: factorize_batch(number),
+}
+
+
+def workers_cpu_seconds() -> float:
+    """CPU time of the live pool workers; os.times() only counts children that have exited."""
+    pool = main_process._pool
+    if pool is None or not sys.platform.startswith("linux"):
+        return 0.0
+    total = 0
+    for process in pool._pool:
+        try:
+            with open(f"/proc/{process.pid}/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])     # utime + stime у тиках
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def reset_cache() -> None:
+    # кеш вимкнений, інакше кожен наступний повтор міряв би лише пошук у кеші
+    main_process.cache = DivisorCache(maxsize=0)
+
+
+def measure(engine, numbers: list, repeat: int) -> dict:
+    best_wall, best_cpu = None, None
+    for _ in range(repeat):
+        reset_cache()
+        cpu_started = process_time() + workers_cpu_seconds()
+        started = perf_counter()
+        result = engine(*numbers)
+        wall = perf_counter() - started
+        cpu = process_time() + workers_cpu_seconds() - cpu_started
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+
+    # пам'ять міряємо окремим прогоном: tracemalloc помітно сповільнює код
+    reset_cache()
+    tracemalloc.start()
+    engine(*numbers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"wall_seconds": best_wall, "cpu_seconds": best_cpu, "peak_memory_bytes": peak, "result": result}
+
+
+def check_reference(name: str, engine) -> None:
+    reset_cache()
+    result = engine(*REFERENCE)
+    assert result == list(REFERENCE.values()), f"{name} returned wrong divisors for the reference numbers"
+
+
+def run(sizes: list[int], distributions: list[str], engines: list[str], repeat: int, seed: int) -> list[dict]:
+    main_process.WORKER_CACHE_SIZE = 0
+    if "process" in engines:
+        main_process.get_pool()     # старт пулу не входить у заміри
+
+    for name in engines:
+        check_reference(name, ENGINES[name])
+
+    rows = []
+    for distribution in distributions:
+        for size in sizes:
+            numbers = DISTRIBUTIONS[distribution](random.Random(seed), size)
+            expected = None
+            for name in engines:
+                if name == "vectorized" and max(numbers) >= BATCH_LIMIT:
+                    continue
+                measured = measure(ENGINES[name], numbers, repeat)
+                result = measured.pop("result")
+                if expected is None:
+                    expected = result
+                row = {
+                    "engine": name,
+                    "distribution": distribution,
+                    "size": len(numbers),
+                    **measured,
+                    "numbers_per_second": len(numbers) / measured["wall_seconds"],
+                    "matches": result == expected,
+                }
+                print(f"{distribution:>9} {len(numbers):>8} {name:>10}: {row['wall_seconds']:.4f} s wall, "
+                      f"{row['cpu_seconds']:.4f} s cpu, {row['peak_memory_bytes'] / 2 ** 20:.1f} MB peak")
+                rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the factorize engines")
+    parser.add_argument("--sizes", "-n", help="Batch sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--distributions", "-d", help="Input distributions", nargs="+",
+                        choices=list(DISTRIBUTIONS), default=list(DISTRIBUTIONS))
+    parser.add_argument("--engines", "-e", help="Engines to compare", nargs="+",
+                        choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--repeat", "-r", help="Runs per case, the best one is reported", type=int, default=3)
+    parser.add_argument("--seed", help="Random seed for the inputs", type=int, default=42)
+    parser.add_argument("--json", help="Write the report as JSON")
+    parser.add_argument("--csv", help="Write the report as CSV")
+    args = parser.parse_args()
+
+    engines = args.engines
+    if main_process.np is None and "vectorized" in engines:
+        print("numpy is not installed, skipping the vectorized engine")
+        engines = [name for name in engines if name != "vectorized"]
+
+    rows = run(args.sizes, args.distributions, engines, max(1, args.repeat), args.seed)
+
+    if not all(row["matches"] for row in rows):
+        print("Some engines returned results that differ from the sequential ones")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"cpu_count": os.cpu_count(), "seed": args.seed, "results": rows}, file, indent=2)
+    if args.csv and rows:
+        with open(args.csv, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
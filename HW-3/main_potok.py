@@ -1,18 +1,44 @@
 import argparse
+import errno
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from shutil import copyfile
-from threading import Thread
+from queue import Queue
+from shutil import copyfileobj
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Iterable, Iterator
 import logging
 
 """
 --source [-s]
 --output [-o] default folder = sort
+--workers [-w] default = cpu_count() * 4
+--mode [-m] copy | move | hardlink, default = copy
+--full ignore the manifest and process every file again
+--dedup store identical files once and hardlink the duplicates
+--stats report progress periodically and print a JSON summary at the end
+--stats-interval seconds between progress reports, default = 5
 """
 
 
 parser = argparse.ArgumentParser(description="Sorting files in a directory")
 parser.add_argument("--source", "-s", help="Source directory", required=True)
 parser.add_argument("--output", "-o", help="Output directory", default="files_by_type")
+parser.add_argument("--workers", "-w", help="Number of copy workers", type=int, default=(os.cpu_count() or 1) * 4)
+parser.add_argument("--mode", "-m", help="How files get into the output directory",
+                    choices=("copy", "move", "hardlink"), default="copy")
+parser.add_argument("--full", help="Ignore the manifest of previous runs", action="store_true")
+parser.add_argument("--dedup", help="Store identical files once, hardlink the duplicates", action="store_true")
+parser.add_argument("--stats", help="Report progress and print a JSON summary", action="store_true")
+parser.add_argument("--stats-interval", help="Seconds between progress reports", type=float, default=5)
 
 print(parser.parse_args())
 args = vars(parser.parse_args())
@@ -20,42 +46,440 @@ print(args)
 
 source = Path(args.get("source"))
 output = Path(args.get("output"))
+workers = max(1, args.get("workers"))
+mode = args.get("mode")
+full = args.get("full")
+dedup = args.get("dedup")
+show_stats = args.get("stats")
+stats_interval = args.get("stats_interval")
 
-directories = []
+# розмір черги обмежений, щоб пам'ять не росла разом із кількістю файлів у дереві
+files_queue = Queue(maxsize=workers * 64)
+STOP = None
 
 
-def process_folder(path: Path) -> None:
-    for el in path.iterdir():
-        if el.is_dir():
-            directories.append(el)  # додаємо до списку шлях до вкладеної директороії
-            process_folder(el)      # перевіряємо даний елемент на наявність вкладених директорій
+def scan_files(path: Path) -> Iterator[os.DirEntry]:
+    """Yields files of the tree one by one, without recursion and without building the full list."""
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    # DirEntry кешує тип елемента, тож додаткових stat() тут немає
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)    # вкладену директорію обійдемо пізніше
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            logging.error(e)
 
 
-def copy_file(path: Path) -> None:
-    for el in path.iterdir():
-        if el.is_file():
-            ext = el.suffix[1:]     # отримуємо розширення файлу
-            ext_dir = output / ext  # зберігаємо шлях до директорії з розширенням конкретного файлу
+FICLONE = 0x40049409     # ioctl з linux/fs.h: клонування файлу без копіювання даних (btrfs, xfs)
+COPY_CHUNK = 1024 * 1024 * 8
+# помилки, після яких бекенд не підтримується цією файловою системою і його варто пропускати
+UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF}
 
+disabled_backends = set()
+
+
+def reflink(src_fd: int, dst_fd: int, size: int) -> None:
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def copy_range(src_fd: int, dst_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+        if sent == 0:
+            break
+        copied += sent
+
+
+def send_file(src_fd: int, dst_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(dst_fd, src_fd, copied, min(COPY_CHUNK, size - copied))
+        if sent == 0:
+            break
+        copied += sent
+
+
+COPY_BACKENDS = []
+if sys.platform == "linux":
+    COPY_BACKENDS.append(reflink)
+if hasattr(os, "copy_file_range"):
+    COPY_BACKENDS.append(copy_range)
+if hasattr(os, "sendfile"):
+    COPY_BACKENDS.append(send_file)
+
+
+def copy_data(src: str, dst: Path, exclusive: bool = False) -> None:
+    """Copies the file with the fastest backend available: reflink, copy_file_range, sendfile, read/write.
+
+    With exclusive=True an existing dst is not overwritten: FileExistsError is raised instead.
+    """
+    with open(src, "rb") as fsrc, open(dst, "xb" if exclusive else "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for backend in COPY_BACKENDS:
+            if backend.__name__ in disabled_backends:
+                continue
             try:
-                ext_dir.mkdir(exist_ok=True, parents=True)   # створюємо директорію, якщо вона не існує
-                copyfile(el, ext_dir / el.name)     # копіюємо файл
+                backend(fsrc.fileno(), fdst.fileno(), size)
+                return
             except OSError as e:
-                logging.error(e)
+                if e.errno not in UNSUPPORTED:
+                    raise
+                disabled_backends.add(backend.__name__)
+                # бекенд міг встигнути щось записати, тому починаємо наступний з чистого файлу
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        copyfileobj(fsrc, fdst, COPY_CHUNK)
+
+
+def numbered(dst: Path) -> Iterator[Path]:
+    """Yields dst, then "name (1).ext", "name (2).ext" and so on."""
+    yield dst
+    for i in itertools.count(1):
+        yield dst.with_name(f"{dst.stem} ({i}){dst.suffix}")
+
+
+def link_new(src: str | Path, dst: Path) -> Path:
+    """Hardlinks src under the first free name from numbered(dst); never replaces another file."""
+    for candidate in numbered(dst):
+        try:
+            os.link(src, candidate)     # на відміну від replace, link не перезаписує існуючий файл
+            return candidate
+        except FileExistsError:
+            if os.path.samefile(src, candidate):
+                return candidate    # уже перенесений раніше, напр. перерваним запуском
+
+
+def copy_new(src: str, dst: Path) -> Path:
+    for candidate in numbered(dst):
+        try:
+            copy_data(src, candidate, exclusive=True)
+            return candidate
+        except FileExistsError:
+            continue
+
+
+def transfer(src: str, dst: Path) -> Path:
+    """Puts src into the output according to --mode; returns the path it ended up at."""
+    if mode == "move":
+        # у move джерело видаляється, тож файл з тим самим ім'ям в output отримує інше ім'я, а не затирається
+        try:
+            target = link_new(src, dst)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            target = copy_new(src, dst)
+        os.remove(src)
+        return target
+    elif mode == "hardlink":
+        try:
+            if dst.exists():
+                dst.unlink()
+            os.link(src, dst)
+            return dst
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+        copy_data(src, dst)
+    else:
+        copy_data(src, dst)
+    return dst
+
+
+class Stats:
+    SLOWEST = 10
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = perf_counter()
+        self.counters = Counter()
+        self.timings = Counter()
+        self.extensions = Counter()
+        self.files = 0
+        self.bytes = 0
+        self.slowest = []   # мін-купа з SLOWEST найповільніших файлів
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += n
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.timings[stage] += seconds
+
+    def add_file(self, path: str, ext: str, size: int, seconds: float) -> None:
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            self.extensions[ext] += 1
+            self.timings["copy"] += seconds
+            if len(self.slowest) < self.SLOWEST:
+                heapq.heappush(self.slowest, (seconds, path))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, path))
+
+    def progress(self) -> str:
+        with self.lock:
+            elapsed = perf_counter() - self.started
+            return (f"{self.files} files, {self.bytes / 2 ** 20:.1f} MB, "
+                    f"{self.files / elapsed:.1f} files/s, {self.bytes / 2 ** 20 / elapsed:.1f} MB/s")
+
+    def summary(self) -> dict:
+        with self.lock:
+            elapsed = perf_counter() - self.started
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "files": self.files,
+                "bytes": self.bytes,
+                "files_per_second": round(self.files / elapsed, 1),
+                "mb_per_second": round(self.bytes / 2 ** 20 / elapsed, 2),
+                # час копіювання — сума по всіх потоках, тому він може бути більшим за elapsed
+                "scan_seconds": round(self.timings["scan"], 3),
+                "copy_seconds": round(self.timings["copy"], 3),
+                "counters": dict(self.counters),
+                "extensions": dict(self.extensions.most_common()),
+                "slowest": [{"path": path, "seconds": round(seconds, 4)}
+                            for seconds, path in sorted(self.slowest, reverse=True)],
+            }
+
+
+def report_progress(stop: Event) -> None:
+    while not stop.wait(stats_interval):
+        logging.info(stats.progress())
+
+
+def timed_scan(entries: Iterator[os.DirEntry]) -> Iterator[os.DirEntry]:
+    """Measures only the time spent inside the scanner, not the time spent waiting on the queue."""
+    while True:
+        started = perf_counter()
+        entry = next(entries, None)
+        stats.add_time("scan", perf_counter() - started)
+        if entry is None:
+            return
+        yield entry
+
+
+stats = Stats()
+
+created_dirs = set()
+created_dirs_lock = Lock()
+
+
+def ensure_dir(path: Path) -> None:
+    """Creates the directory once per run; later calls are answered from memory without a syscall."""
+    if path in created_dirs:
+        stats.count("mkdir_saved")
+        return
+    with created_dirs_lock:
+        # інший потік міг створити директорію, поки ми чекали на lock
+        if path not in created_dirs:
+            path.mkdir(exist_ok=True, parents=True)
+            stats.count("mkdir_calls")
+            created_dirs.add(path)
+            return
+    stats.count("mkdir_saved")
+
+
+def destination(entry: os.DirEntry) -> Path:
+    ext = os.path.splitext(entry.name)[1][1:]   # отримуємо розширення файлу
+    ext_dir = output / ext  # зберігаємо шлях до директорії з розширенням конкретного файлу
+    ensure_dir(ext_dir)   # створюємо директорію, якщо вона не існує
+    return ext_dir / entry.name
+
+
+def record(entry: os.DirEntry, st: os.stat_result, started: float) -> None:
+    ext = os.path.splitext(entry.name)[1][1:]
+    stats.add_file(entry.path, ext, st.st_size, perf_counter() - started)
+    if manifest:
+        manifest.add(os.path.abspath(entry.path), st)
+
+
+def copy_file(entry: os.DirEntry) -> None:
+    try:
+        started = perf_counter()
+        st = entry.stat()   # до transfer: у режимі move джерела після нього вже немає
+        dst = destination(entry)
+        transfer(entry.path, dst)     # копіюємо файл
+        record(entry, st, started)
+    except OSError as e:
+        logging.error(e)
+
+
+def copy_group(group: list[os.DirEntry]) -> None:
+    """Transfers the first file of a group of identical files and hardlinks the rest to it."""
+    original, *duplicates = group
+    try:
+        started = perf_counter()
+        st = original.stat()
+        original_dst = transfer(original.path, destination(original))
+        record(original, st, started)
+    except OSError as e:
+        logging.error(e)
+        return
+
+    for entry in duplicates:
+        try:
+            started = perf_counter()
+            st = entry.stat()
+            dst = destination(entry)
+            if mode == "move":
+                link_new(original_dst, dst)
+                os.remove(entry.path)
+            elif dst != original_dst:     # однакові ім'я та вміст — другий файл просто не потрібен
+                if dst.exists():
+                    dst.unlink()
+                os.link(original_dst, dst)
+            record(entry, st, started)
+            stats.count("duplicates")
+        except OSError as e:
+            logging.error(e)
+
+
+HASH_CHUNK = 1024 * 1024
+
+
+def hash_file(entry: os.DirEntry) -> str | None:
+    # hashlib відпускає GIL на великих блоках, тож потоки рахують хеші паралельно
+    digest = hashlib.blake2b()
+    try:
+        with open(entry.path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK):
+                digest.update(chunk)
+    except OSError as e:
+        logging.error(e)
+        return None
+    return digest.hexdigest()
+
+
+def group_duplicates(entries: Iterable[os.DirEntry]) -> Iterator[list[os.DirEntry]]:
+    """Groups files by content: by size first, and only files with a colliding size are hashed."""
+    by_size = defaultdict(list)
+    for entry in entries:
+        by_size[entry.stat().st_size].append(entry)
+
+    candidates = []
+    for group in by_size.values():
+        if len(group) == 1:
+            yield group     # файл унікального розміру не може мати дублікатів
+        else:
+            candidates.extend(group)
+    del by_size
+
+    by_hash = defaultdict(list)
+    with ThreadPoolExecutor(workers, thread_name_prefix="Hasher") as pool:
+        for entry, digest in zip(candidates, pool.map(hash_file, candidates)):
+            if digest is None:
+                yield [entry]
+            else:
+                by_hash[(entry.stat().st_size, digest)].append(entry)
+    yield from by_hash.values()
+
+
+class Manifest:
+    """Remembers processed files (path, size, mtime) in SQLite so the next run copies only new or changed ones."""
+
+    FILENAME = ".manifest.sqlite"
+    COMMIT_EVERY = 1000
+
+    def __init__(self, path: Path):
+        self.lock = Lock()
+        self.pending = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)"
+        )
+
+    def is_done(self, path: str, st: os.stat_result) -> bool:
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        return row == (st.st_size, st.st_mtime_ns)
+
+    def add(self, path: str, st: os.stat_result) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns),
+            )
+            self.pending += 1
+            # комітимо пачками: перерваний запуск втратить щонайбільше COMMIT_EVERY записів
+            if self.pending >= self.COMMIT_EVERY:
+                self.connection.commit()
+                self.pending = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+manifest = None
+
+
+def worker() -> None:
+    while True:
+        item = files_queue.get()
+        try:
+            if item is STOP:
+                return
+            if isinstance(item, list):
+                copy_group(item)
+            else:
+                copy_file(item)
+        finally:
+            files_queue.task_done()
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format="%(threadName)s %(message)s")
 
-    directories.append(source)
-    process_folder(source)
-    logging.info(f"{directories}")
+    output.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(output / Manifest.FILENAME)
+    skipped = 0
+    pending = []
+    stop_reporting = Event()
+    if show_stats:
+        Thread(target=report_progress, args=(stop_reporting,), name="Stats", daemon=True).start()
+    logging.info(f"Starting {workers} workers")
 
     threads = []
-    for directory in directories:
-        th = Thread(target=copy_file, args=(directory,))
+    for i in range(workers):
+        th = Thread(target=worker, name=f"Worker-{i}")
         th.start()
         threads.append(th)
 
-    [th.join() for th in threads]
+    try:
+        # копіювання починається одразу, паралельно зі скануванням
+        for entry in timed_scan(scan_files(source)):
+            if not full and manifest.is_done(os.path.abspath(entry.path), entry.stat()):
+                skipped += 1    # файл не змінився з попереднього запуску
+                continue
+            if dedup:
+                pending.append(entry)   # дублікати можна знайти лише після повного сканування
+            else:
+                files_queue.put(entry)     # блокується, доки у черзі не звільниться місце
+
+        if dedup:
+            for group in group_duplicates(pending):
+                files_queue.put(group)
+    finally:
+        for _ in threads:
+            files_queue.put(STOP)
+
+        [th.join() for th in threads]
+        manifest.close()
+
+    logging.info(f"Skipped {skipped} unchanged files")
+    stop_reporting.set()
+    if show_stats:
+        stats.count("skipped", skipped)
+        print(json.dumps(stats.summary(), ensure_ascii=False, indent=2))
     logging.info(f"Done! Can be delete the \"{source}\"")
@@ -1,29 +1,350 @@
+import atexit
+import json
+import sqlite3
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from math import gcd, isqrt
 from multiprocessing import Pool, cpu_count
-from time import time, sleep
+from random import randrange
+from threading import Lock
+from time import time
+
+try:
+    import numpy as np
+except ImportError:     # numpy потрібен лише для factorize_batch
+    np = None
+
+SIEVE_LIMIT = 1 << 16   # простих до 65536 достатньо, щоб перебором розкласти будь-яке число до 2**32
+
+
+@lru_cache(maxsize=None)
+def small_primes(limit=SIEVE_LIMIT):
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0:2] = b"\x00\x00"
+    for i in range(2, isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit + 1, i)))
+    return [i for i in range(limit + 1) if sieve[i]]
+
+
+def is_prime(num):
+    """Miller-Rabin; with these bases the answer is exact for every num < 3.3 * 10**24."""
+    if num < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41):
+        if num % p == 0:
+            return num == p
+    d, r = num - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41):
+        x = pow(a, d, num)
+        if x in (1, num - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % num
+            if x == num - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_rho(num):
+    """Returns some non-trivial divisor of a composite num (Brent's variant)."""
+    if num % 2 == 0:
+        return 2
+    while True:
+        y, c, m = randrange(1, num), randrange(1, num), 128
+        g, r, q = 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % num
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % num
+                    q = q * abs(x - y) % num
+                g = gcd(q, num)
+                k += m
+            r *= 2
+        if g == num:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % num
+                g = gcd(abs(x - ys), num)
+        if g != num:
+            return g
+
+
+def prime_factors(num):
+    """Returns {prime: exponent} for num >= 1."""
+    factors = {}
+    for p in small_primes():
+        if p * p > num:
+            break
+        while num % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            num //= p
+
+    stack = [num] if num > 1 else []
+    while stack:
+        n = stack.pop()
+        # після перебору залишок без дільників до SIEVE_LIMIT, тож якщо він менший за квадрат межі — простий
+        if n < SIEVE_LIMIT * SIEVE_LIMIT or is_prime(n):
+            factors[n] = factors.get(n, 0) + 1
+        else:
+            d = pollard_rho(n)
+            stack.extend((d, n // d))
+    return factors
+
+
+def divisors(num):
+    result = [1]
+    for p, e in prime_factors(num).items():
+        result = [d * p ** k for d in result for k in range(e + 1)]
+    result.sort()
+    return result
+
+
+class DivisorCache:
+    """LRU cache of divisor lists, optionally backed by a SQLite file that survives restarts."""
+
+    COMMIT_EVERY = 1000
+
+    def __init__(self, maxsize=65536, path=None):
+        self.maxsize = maxsize
+        self.pending = 0
+        self.lock = Lock()
+        self.items = OrderedDict()
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            # число зберігаємо текстом: воно може не влізти в INTEGER SQLite
+            self.connection.execute("CREATE TABLE IF NOT EXISTS divisors (num TEXT PRIMARY KEY, divisors TEXT)")
+            atexit.register(self.close)
+
+    def get(self, num):
+        with self.lock:
+            if num in self.items:
+                self.items.move_to_end(num)
+                return list(self.items[num])    # копія, щоб зміни у відповіді не зіпсували кеш
+            if self.connection is None:
+                return None
+            row = self.connection.execute("SELECT divisors FROM divisors WHERE num = ?", (str(num),)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        self._remember(num, result)
+        return list(result)
+
+    def put(self, num, result):
+        self._remember(num, list(result))
+        if self.connection is not None:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO divisors (num, divisors) VALUES (?, ?)", (str(num), json.dumps(result))
+                )
+                self.pending += 1
+                if self.pending >= self.COMMIT_EVERY:
+                    self.connection.commit()
+                    self.pending = 0
+
+    def _remember(self, num, result):
+        with self.lock:
+            self.items[num] = result
+            self.items.move_to_end(num)
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.commit()
+                self.connection.close()
+                self.connection = None
+
+
+# спільний кеш для factorize і factorize_many; для збереження між запусками
+# його можна замінити: cache = DivisorCache(path="divisors.sqlite")
+cache = DivisorCache()
+
+
+def cached_factorize_one(num):
+    result = cache.get(num)
+    if result is None:
+        result = factorize_one(num)
+        cache.put(num, result)
+    return result
 
 
 def factorize(*number):
-    s = []
-    for num in number:
-        n = []
-        for i in range(1, num+1):
-            if num % i == 0:
-                n.append(i)
-        s.append(n)
-    return s
+    return [cached_factorize_one(num) for num in number]
 
 
 def factorize_one(num):
-    n = []
-    for i in range(1, num+1):
-        if num % i == 0:
-            n.append(i)
-    return n
+    if num < 1:
+        return []   # як і перебір range(1, num+1), для нуля та від'ємних чисел дільників немає
+    return divisors(num)
+
+
+_pool = None
+WORKER_CACHE_SIZE = 65536
+
+
+def get_pool():
+    """Returns the process pool shared by all calls; it is created once and closed at exit."""
+    global _pool
+    if _pool is None:
+        _pool = Pool(cpu_count(), initializer=_init_worker)
+        atexit.register(shutdown_pool)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def _init_worker():
+    # кожен процес має власний кеш лише в пам'яті: з'єднання SQLite не можна ділити між процесами,
+    # а спільний кеш поповнює батьківський процес результатами воркерів
+    global cache
+    cache = DivisorCache(WORKER_CACHE_SIZE)
+
+
+def _factorize_indexed(item):
+    index, num = item
+    return index, cached_factorize_one(num)
+
+
+def _lookup(number):
+    """Splits the input into cached results and (index, num) tasks for numbers still to compute."""
+    results = [cache.get(num) for num in number]
+    tasks = {}
+    for index, num in enumerate(number):
+        if results[index] is None and num not in tasks:
+            tasks[num] = index      # однакові числа рахуємо один раз
+    return results, [(index, num) for num, index in tasks.items()]
+
+
+def _schedule(tasks):
+    # найбільші числа — першими, щоб наприкінці не чекати на один довгий хвіст
+    tasks = sorted(tasks, key=lambda item: item[1], reverse=True)
+    # дрібніші шматки, ніж у map за замовчуванням: краще балансування без зайвих пересилань
+    chunksize = max(1, min(len(tasks) // (cpu_count() * 16), 1024))
+    return tasks, chunksize
+
+
+BATCH_LIMIT = 2 * 10 ** 7     # решето int32 такого розміру займає ~80 МБ
+_spf = None
+
+
+def smallest_prime_factors(limit):
+    """Sieve where spf[n] is the smallest prime factor of n; reused while it covers the limit."""
+    global _spf
+    if _spf is not None and len(_spf) > limit:
+        return _spf
+    spf = np.zeros(limit + 1, dtype=np.int32)
+    for p in range(2, isqrt(limit) + 1):
+        if spf[p] == 0:
+            multiples = spf[p * p::p]
+            multiples[multiples == 0] = p
+    spf[spf == 0] = np.flatnonzero(spf == 0)    # ті, що лишились, — прості (а також 0 і 1)
+    _spf = spf
+    return spf
+
+
+def factorize_batch(array, compact=False):
+    """Vectorized divisors of many integers below BATCH_LIMIT.
+
+    Returns a list of divisor lists like factorize, or with compact=True
+    an (offsets, values) pair where the divisors of array[i] are
+    values[offsets[i]:offsets[i + 1]].
+    """
+    if np is None:
+        raise ImportError("factorize_batch requires numpy")
+    nums = np.asarray(array, dtype=np.int64).ravel()
+    if nums.size and nums.max() >= BATCH_LIMIT:
+        raise ValueError(f"factorize_batch supports numbers below {BATCH_LIMIT}, use factorize_many")
+
+    valid = np.flatnonzero(nums >= 1)   # для чисел < 1 дільників немає, як і у factorize_one
+    # решето будуємо щонайменше до 1: вхід може складатися лише з нуля чи від'ємних чисел
+    spf = smallest_prime_factors(max(int(nums.max()), 1) if nums.size else 1)
+
+    # розклад на прості: на кожному кроці відділяємо найменший простий дільник разом зі степенем
+    rest = nums[valid].copy()
+    primes, exponents = [], []
+    while (rest > 1).any():
+        p = spf[rest].astype(np.int64)
+        p[rest == 1] = 1
+        e = np.zeros_like(rest)
+        while (mask := (p > 1) & (rest % p == 0)).any():
+            rest[mask] //= p[mask]
+            e[mask] += 1
+        primes.append(p)
+        exponents.append(e)
+
+    # кожен простий множить наявні дільники на p**1..p**e; порядок відновить сортування нижче
+    owner = np.arange(len(valid))
+    values = np.ones(len(valid), dtype=np.int64)
+    for p, e in zip(primes, exponents):
+        owners, parts = [owner], [values]
+        current, current_owner = values, owner
+        for k in range(1, int(e.max()) + 1):
+            mask = e[current_owner] >= k
+            current_owner = current_owner[mask]
+            current = current[mask] * p[current_owner]
+            owners.append(current_owner)
+            parts.append(current)
+        owner, values = np.concatenate(owners), np.concatenate(parts)
+    # один ключ (номер числа, дільник) сортується значно швидше за np.lexsort
+    keys = np.sort(owner * BATCH_LIMIT + values)
+    owner, values = np.divmod(keys, BATCH_LIMIT)
+
+    counts = np.zeros(len(nums), dtype=np.int64)
+    counts[valid] = np.bincount(owner, minlength=len(valid))
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    if compact:
+        return offsets, values
+    values, offsets = values.tolist(), offsets.tolist()
+    return [values[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def factorize_stream(*number):
+    """Yields (num, divisors) pairs: cached ones first, the rest in the order the workers finish them."""
+    results, tasks = _lookup(number)
+    missing = Counter()
+    for num, result in zip(number, results):
+        if result is None:
+            missing[num] += 1
+        else:
+            yield num, result
+    tasks, chunksize = _schedule(tasks)
+    for index, result in get_pool().imap_unordered(_factorize_indexed, tasks, chunksize):
+        num = number[index]
+        cache.put(num, result)
+        for _ in range(missing[num]):
+            yield num, list(result)
 
 
 def factorize_many(*number):
-    with Pool(cpu_count()) as pool:
-        return pool.map(factorize_one, number)
+    results, tasks = _lookup(number)
+    tasks, chunksize = _schedule(tasks)
+    computed = {}
+    for index, result in get_pool().imap_unordered(_factorize_indexed, tasks, chunksize):
+        computed[number[index]] = result
+        cache.put(number[index], result)
+    for index, num in enumerate(number):
+        if results[index] is None:
+            results[index] = list(computed[num])
+    return results
 
 
 if __name__ == "__main__":
@@ -32,13 +353,12 @@ if __name__ == "__main__":
     a, b, c, d = factorize(128, 255, 99999, 10651060)
     print(f"Час виконання функції {round(time() - timer, 5)} секунд")
 
-    sleep(5)
-
+    cache = DivisorCache()  # інакше другий замір просто візьме результати з кешу
     timer = time()
     a1, b1, c1, d1 = factorize_many(128, 255, 99999, 10651060)
     print(f"Час виконання потоків {round(time() - timer, 5)} секунд")
 
-    # assert a == [1, 2, 4, 8, 16, 32, 64, 128]
-    # assert b == [1, 3, 5, 15, 17, 51, 85, 255]
-    # assert c == [1, 3, 9, 41, 123, 271, 369, 813, 2439, 11111, 33333, 99999]
-    # assert d == [1, 2, 4, 5, 7, 10, 14, 20, 28, 35, 70, 140, 76079, 152158, 304316, 380395, 532553, 760790, 1065106, 1521580, 2130212, 2662765, 5325530, 10651060]
+    assert a == a1 == [1, 2, 4, 8, 16, 32, 64, 128]
+    assert b == b1 == [1, 3, 5, 15, 17, 51, 85, 255]
+    assert c == c1 == [1, 3, 9, 41, 123, 271, 369, 813, 2439, 11111, 33333, 99999]
+    assert d == d1 == [1, 2, 4, 5, 7, 10, 14, 20, 28, 35, 70, 140, 76079, 152158, 304316, 380395, 532553, 760790, 1065106, 1521580, 2130212, 2662765, 5325530, 10651060]
@@ -0,0 +1,108 @@
+import errno
+import io
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+# main_potok розбирає аргументи під час імпорту
+with patch.object(sys, "argv", ["main_potok.py", "--source", "."]), redirect_stdout(io.StringIO()):
+    import main_potok
+
+
+class TestMove(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source = Path(tmp.name, "src")
+        self.output = Path(tmp.name, "out")
+        (self.source / "a").mkdir(parents=True)
+        for name, value in [("x.txt", "one"), ("a/x.txt", "two")]:
+            Path(self.source, name).write_text(value)
+        for name, value in [("mode", "move"), ("output", self.output), ("stats", main_potok.Stats()),
+                            ("created_dirs", set()), ("manifest", None)]:
+            patcher = patch.object(main_potok, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sorted_files(self) -> dict:
+        return {path.name: path.read_text() for path in (self.output / "txt").iterdir()}
+
+    def test_same_name_is_not_overwritten(self):
+        for entry in main_potok.scan_files(self.source):
+            main_potok.copy_file(entry)
+        self.assertEqual(sorted(self.sorted_files().values()), ["one", "two"])
+        self.assertEqual(set(self.sorted_files()), {"x.txt", "x (1).txt"})
+        self.assertEqual(list(main_potok.scan_files(self.source)), [])
+
+    def test_same_name_is_not_overwritten_across_devices(self):
+        with patch.object(main_potok.os, "link", side_effect=OSError(errno.EXDEV, "cross-device link")):
+            for entry in main_potok.scan_files(self.source):
+                main_potok.copy_file(entry)
+        self.assertEqual(sorted(self.sorted_files().values()), ["one", "two"])
+        self.assertEqual(list(main_potok.scan_files(self.source)), [])
+
+    def test_dedup_group_keeps_existing_file(self):
+        Path(self.source, "b").mkdir()
+        Path(self.source, "b/x.txt").write_text("two")
+        main_potok.copy_file(next(e for e in os.scandir(self.source) if e.name == "x.txt"))
+        group = [next(os.scandir(self.source / "a")), next(os.scandir(self.source / "b"))]
+        main_potok.copy_group(group)
+        files = self.sorted_files()
+        self.assertEqual(files["x.txt"], "one")
+        self.assertEqual(files["x (1).txt"], "two")
+        self.assertEqual(len(files), 2)     # дублікат — той самий файл, а не ще одна копія
+        self.assertEqual(main_potok.stats.files, 3)
+        self.assertEqual(list(main_potok.scan_files(self.source)), [])
+
+    def test_moved_files_are_recorded(self):
+        manifest = main_potok.Manifest(self.output.parent / main_potok.Manifest.FILENAME)
+        self.addCleanup(manifest.close)
+        sizes = {os.path.abspath(entry.path): entry.stat(follow_symlinks=False).st_size
+                 for entry in main_potok.scan_files(self.source)}
+        with patch.object(main_potok, "manifest", manifest):
+            for entry in main_potok.scan_files(self.source):
+                main_potok.copy_file(entry)
+        self.assertEqual(main_potok.stats.files, 2)
+        self.assertEqual(main_potok.stats.bytes, sum(sizes.values()))
+        rows = dict(manifest.connection.execute("SELECT path, size FROM files"))
+        self.assertEqual(rows, sizes)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name, main_potok.Manifest.FILENAME)
+        self.file = Path(tmp.name, "file.txt")
+        self.file.write_text("data")
+
+    def test_unchanged_file_is_done_after_reopen(self):
+        manifest = main_potok.Manifest(self.path)
+        self.assertFalse(manifest.is_done(str(self.file), self.file.stat()))
+        manifest.add(str(self.file), self.file.stat())
+        manifest.close()
+
+        manifest = main_potok.Manifest(self.path)
+        self.addCleanup(manifest.close)
+        self.assertTrue(manifest.is_done(str(self.file), self.file.stat()))
+
+    def test_changed_file_is_not_done(self):
+        manifest = main_potok.Manifest(self.path)
+        self.addCleanup(manifest.close)
+        manifest.add(str(self.file), self.file.stat())
+
+        self.file.write_text("more data")
+        self.assertFalse(manifest.is_done(str(self.file), self.file.stat()))
+
+        st = self.file.stat()
+        manifest.add(str(self.file), st)
+        os.utime(self.file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))    # той самий розмір, інший mtime
+        self.assertFalse(manifest.is_done(str(self.file), self.file.stat()))
+
+
+if __name__ == "__main__":
+    unittest.main()
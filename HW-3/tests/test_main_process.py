@@ -0,0 +1,76 @@
+import random
+import unittest
+from unittest.mock import patch
+
+import main_process
+from main_process import DivisorCache, factorize, factorize_batch, factorize_many, factorize_one
+
+
+def trial_division(num):
+    return [i for i in range(1, num + 1) if num % i == 0]
+
+
+class TestFactorize(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = patch.object(main_process, "cache", DivisorCache(maxsize=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_matches_trial_division(self):
+        numbers = list(range(-3, 2000)) + [2 ** 16 + 1, 65521 ** 2, 10651060, 99999, 2 ** 20]
+        self.assertEqual(factorize(*numbers), [trial_division(num) for num in numbers])
+
+    def test_large_numbers(self):
+        rnd = random.Random(1)
+        for num in [rnd.randrange(10 ** 9, 10 ** 12) for _ in range(20)] + [999999000001, 2 ** 61 - 1]:
+            result = factorize_one(num)
+            self.assertEqual(result, sorted(set(result)))
+            self.assertTrue(all(num % d == 0 for d in result))
+            # дільники йдуть парами d і num // d
+            self.assertEqual(result, sorted(num // d for d in result))
+
+    def test_factorize_many_matches_factorize(self):
+        numbers = [128, 255, 99999, 10651060, 255, 0, -7, 1]
+        self.assertEqual(factorize_many(*numbers), factorize(*numbers))
+
+
+class TestDivisorCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = DivisorCache(maxsize=2)
+        cache.put(4, [1, 2, 4])
+        cache.put(6, [1, 2, 3, 6])
+        cache.get(4)
+        cache.put(9, [1, 3, 9])
+        self.assertEqual(cache.get(4), [1, 2, 4])
+        self.assertIsNone(cache.get(6))
+
+
+@unittest.skipIf(main_process.np is None, "numpy is not installed")
+class TestFactorizeBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        # кожен тест будує решето з нуля, як у свіжому процесі
+        patcher = patch.object(main_process, "_spf", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_matches_trial_division(self):
+        numbers = list(range(-3, 3000)) + [9973 * 2, 2 ** 20, 10651060]
+        self.assertEqual(factorize_batch(numbers), [trial_division(num) for num in numbers])
+
+    def test_only_non_positive_numbers(self):
+        self.assertEqual(factorize_batch([-5]), [[]])
+        self.assertEqual(factorize_batch([0, -1]), [[], []])
+        self.assertEqual(factorize_batch([]), [])
+
+    def test_compact(self):
+        offsets, values = factorize_batch([6, -1, 4], compact=True)
+        self.assertEqual(offsets.tolist(), [0, 4, 4, 7])
+        self.assertEqual(values.tolist(), [1, 2, 3, 6, 1, 2, 4])
+
+    def test_rejects_numbers_above_limit(self):
+        with self.assertRaises(ValueError):
+            factorize_batch([main_process.BATCH_LIMIT])
+
+
+if __name__ == "__main__":
+    unittest.main()
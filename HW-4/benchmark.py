@@ -0,0 +1,173 @@
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import socket
+import tempfile
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Thread
+from time import monotonic, perf_counter, sleep
+
+import main
+
+"""
+Starts the HTTP and UDP servers of main.py on free local ports with a temporary
+storage and drives concurrent GET/POST traffic against them.
+
+--requests [-n] default = 5000
+--concurrency [-c] default = 32
+--post-ratio [-p] default = 0.2
+--message-size default = 100
+--json report file
+"""
+
+GET_PATHS = ['/', '/message', '/style.css', '/logo.png', '/messages?limit=10']
+
+
+def free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def start_servers(storage_dir):
+    main.MyHWFramework.log_message = lambda *args: None
+    main.static_index = main.StaticIndex()
+    main.storage = main.MessageStorage(Path(storage_dir, 'data.json'), Path(storage_dir, 'data.jsonl'))
+    main.message_writer = main.MessageWriter(main.storage)
+
+    udp_port = free_port(socket.SOCK_DGRAM)
+    main.forwarder = main.MessageForwarder('127.0.0.1', udp_port)
+    Thread(target=main.run_socket_server, args=('127.0.0.1', udp_port), name='Socket', daemon=True).start()
+
+    http_server = main.PooledHTTPServer(('127.0.0.1', free_port(socket.SOCK_STREAM)), main.MyHWFramework)
+    Thread(target=http_server.serve_forever, name='HTTP', daemon=True).start()
+    return http_server
+
+
+def client(port, count, post_ratio, message_size, seed):
+    """Sends count requests over one keep-alive connection; returns [(kind, seconds, status, bytes)]."""
+    rnd = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    results = []
+    for i in range(count):
+        if rnd.random() < post_ratio:
+            kind = 'POST'
+            body = urllib.parse.urlencode({'username': f'user{seed}', 'message': 'x' * message_size}).encode()
+            started = perf_counter()
+            try:
+                connection.request('POST', '/message', body=body,
+                                   headers={'Content-Type': 'application/x-www-form-urlencoded'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = None
+            results.append((kind, perf_counter() - started, status, len(body)))
+        else:
+            kind = 'GET'
+            path = rnd.choice(GET_PATHS)
+            started = perf_counter()
+            try:
+                connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = None
+            results.append((kind, perf_counter() - started, status, 0))
+    connection.close()
+    return results
+
+
+def latency_report(results):
+    latencies = [seconds for _, seconds, status, _ in results if status is not None and status < 500]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, _, status, _ in results if status is None or status >= 500),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+
+
+def run(requests, concurrency, post_ratio, message_size, settle_timeout=10):
+    with tempfile.TemporaryDirectory() as storage_dir:
+        http_server = start_servers(storage_dir)
+        port = http_server.server_address[1]
+        sleep(0.1)  # даємо сокет-серверу запуститися
+
+        per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        started = perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            futures = [
+                pool.submit(client, port, count, post_ratio, message_size, seed)
+                for seed, count in enumerate(per_client)
+            ]
+            results = [item for future in futures for item in future.result()]
+        elapsed = perf_counter() - started
+
+        sent = [size for kind, _, status, size in results if kind == 'POST' and status == 302]
+        # чекаємо, доки потік запису збереже все, що встиг отримати сокет-сервер
+        deadline = monotonic() + settle_timeout
+        while monotonic() < deadline:
+            counters = main.message_writer.counters()
+            if counters['received'] >= len(sent) and counters['persisted'] + counters['dropped'] >= counters['received']:
+                break
+            sleep(0.05)
+        counters = main.message_writer.counters()
+
+        http_server.shutdown()
+        http_server.server_close()
+        main.forwarder.close()
+
+        payload = sum(sent)
+        return {
+            'requests': len(results),
+            'concurrency': concurrency,
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'all': latency_report(results),
+            'get': latency_report([item for item in results if item[0] == 'GET']),
+            'post': latency_report([item for item in results if item[0] == 'POST']),
+            'udp': {'sent': len(sent), **counters, 'lost': len(sent) - counters['received']},
+            'storage': {
+                'payload_bytes': payload,
+                'bytes_written': main.storage.bytes_written,
+                'write_amplification': round(main.storage.bytes_written / payload, 2) if payload else None,
+            },
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the HW-4 HTTP + UDP pipeline")
+    parser.add_argument("--requests", "-n", help="Total number of requests", type=int, default=5000)
+    parser.add_argument("--concurrency", "-c", help="Number of concurrent clients", type=int, default=32)
+    parser.add_argument("--post-ratio", "-p", help="Share of POST requests", type=float, default=0.2)
+    parser.add_argument("--message-size", help="Length of the message text in a POST", type=int, default=100)
+    parser.add_argument("--json", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(threadName)s %(message)s')
+    os.chdir(Path(__file__).resolve().parent)   # сторінки й статика беруться відносно каталогу main.py
+
+    report = run(args.requests, max(1, args.concurrency), args.post_ratio, args.message_size)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
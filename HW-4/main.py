@@ -1,97 +1,830 @@
+import bisect
+import errno
+import gzip
+import hashlib
 import json
 import logging
 import mimetypes
+import os
+import re
 import urllib.parse
 import socket
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
-from threading import Thread
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore, Event, Lock, Thread
+from time import monotonic
+
+try:
+    import brotli
+except ImportError:     # без brotli віддаємо лише готові .br-файли
+    brotli = None
 
 BASE_DIR = Path()
-BUFFER_SIZE = 1024
+# найбільший UDP-датаграм для IPv4; менший буфер мовчки обрізав би довгі повідомлення
+BUFFER_SIZE = 65535
+MAX_MESSAGE_SIZE = 65507
 HTTP_PORT = 3000
 HTTP_HOST = '0.0.0.0'
+HTTP_WORKERS = 64
+HTTP_BACKLOG = 1024
+KEEP_ALIVE_TIMEOUT = 5
+STATIC_CACHE_BYTES = 64 * 1024 * 1024
+STATIC_CACHE_MAX_FILE = 1024 * 1024
+STATIC_CHECK_INTERVAL = 1
+SEND_CHUNK = 1024 * 1024
 SOCKET_PORT = 5000
 SOCKET_HOST = '127.0.0.1'
+STORAGE_FILE = BASE_DIR.joinpath('storage/data.json')
+STORAGE_LOG = BASE_DIR.joinpath('storage/data.jsonl')
+COMPACT_EVERY = 10000
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH_SIZE = 256
+WRITE_BATCH_DELAY = 0.05
+SOCKET_RECEIVE_BUFFER = 4 * 1024 * 1024
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 1000
+STATIC_INDEX_INTERVAL = 2
+NOT_FOUND_PAGE = 'error.html'
+# порядок важливий: за однакового q клієнту віддаємо перше з підтримуваних кодувань
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+COMPRESSIBLE_TYPES = {'application/javascript', 'application/json', 'application/xml', 'image/svg+xml'}
+
+
+@dataclass
+class CachedFile:
+    body: bytes | None      # None для великих файлів: вони віддаються з диска через sendfile
+    etag: str
+    last_modified: str
+    mtime: int
+    mtime_ns: int
+    size: int
+    checked: float
+    path: str | None = None     # файл, з якого віддається тіло; None — лише пам'ять
+    variants: dict = field(default_factory=dict)    # кодування -> CachedFile або None
+
+
+def footprint(entry):
+    # стиснені на льоту варіанти живуть разом із файлом; готові .gz/.br — окремі записи кешу
+    return len(entry.body or b'') + sum(
+        len(variant.body) for variant in entry.variants.values() if variant is not None and variant.path is None
+    )
+
+
+def is_compressible(content_type):
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body)
+    return None
+
+
+class StaticCache:
+    """Keeps small files in memory; a file is re-read only when its mtime or size changes.
+
+    Files larger than max_file are cached without a body, only with the headers they need.
+    """
+
+    def __init__(self, max_bytes=STATIC_CACHE_BYTES, max_file=STATIC_CACHE_MAX_FILE):
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, filename):
+        key = str(filename)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        now = monotonic()
+        # stat робимо не частіше, ніж раз на STATIC_CHECK_INTERVAL секунд
+        if entry is not None and now - entry.checked < STATIC_CHECK_INTERVAL:
+            return entry
+
+        stat = os.stat(filename)
+        if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+            entry.checked = now
+            return entry
+
+        if stat.st_size > self.max_file:
+            body = None
+            # великий файл не хешуємо; inode, розмір і mtime змінюються разом зі змістом
+            etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        else:
+            with open(filename, 'rb') as file:
+                body = file.read()
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        entry = CachedFile(
+            body=body,
+            etag=etag,
+            last_modified=formatdate(stat.st_mtime, usegmt=True),
+            mtime=int(stat.st_mtime),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            checked=now,
+            path=key,
+        )
+        self.store(key, entry)
+        return entry
+
+    def store(self, key, entry):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= footprint(old)
+            self.entries[key] = entry
+            self.size += footprint(entry)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= footprint(evicted)
+
+    def encoded(self, entry, encoding):
+        """Returns the file in the given encoding: a ready .gz/.br sibling, or the body compressed once."""
+        if encoding in entry.variants:
+            return entry.variants[encoding]
+        try:
+            variant = self.get(entry.path + ENCODINGS[encoding])
+        except OSError:
+            variant = None
+            if entry.body is not None:
+                body = compress(entry.body, encoding)
+                if body is not None and len(body) < len(entry.body):
+                    variant = CachedFile(
+                        body=body,
+                        etag=f'{entry.etag[:-1]}-{encoding}"',
+                        last_modified=entry.last_modified,
+                        mtime=entry.mtime,
+                        mtime_ns=entry.mtime_ns,
+                        size=len(body),
+                        checked=entry.checked,
+                    )
+        with self.lock:
+            entry.variants[encoding] = variant
+            if variant is not None and variant.path is None and self.entries.get(entry.path) is entry:
+                self.size += len(variant.body)
+        return variant
+
+
+static_cache = StaticCache()
+
+
+class MessageForwarder:
+    """One UDP socket shared by all request threads for sending form data to the socket server."""
+
+    def __init__(self, host=SOCKET_HOST, port=SOCKET_PORT):
+        self.address = (host, port)
+        self.lock = Lock()
+        self.socket = None
+
+    def send(self, data):
+        if len(data) > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {len(data)} bytes does not fit into one datagram")
+        with self.lock:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.connect(self.address)   # адресу й маршрут визначаємо один раз
+            client_socket = self.socket
+        # send для UDP атомарний: кожен виклик — окремий датаграм, тож lock тут не потрібен
+        client_socket.send(data)
+
+    def close(self):
+        with self.lock:
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+
+forwarder = MessageForwarder()
+
+
+class StaticIndex:
+    """Set of files under the root, built once and refreshed by polling directory mtimes.
+
+    Lookups never touch the disk, so a request for a missing file is answered from memory;
+    paths outside the root (e.g. with '..') are simply not in the index.
+    """
+
+    def __init__(self, root=BASE_DIR, interval=STATIC_INDEX_INTERVAL):
+        self.root = Path(root)
+        self.interval = interval
+        self.files = {}
+        self.directories = {}
+        self.stop_event = Event()
+        self.thread = None
+        self.build()
+
+    def build(self):
+        files, directories = {}, {}
+        stack = [(self.root, '')]
+        while stack:
+            directory, prefix = stack.pop()
+            try:
+                directories[directory] = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.name.startswith('.') or entry.name == '__pycache__':
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((directory / entry.name, f'{prefix}{entry.name}/'))
+                        elif entry.is_file():
+                            files[f'{prefix}{entry.name}'] = directory / entry.name
+            except OSError as error:
+                logging.error(error)
+        # заміна цілих словників атомарна, тож читачам lock не потрібен
+        self.files, self.directories = files, directories
+
+    def changed(self):
+        # додавання, видалення чи перейменування файлу змінює mtime його директорії
+        for directory, mtime_ns in self.directories.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def lookup(self, url_path):
+        return self.files.get(urllib.parse.unquote(url_path).lstrip('/'))
+
+    def watch(self):
+        while not self.stop_event.wait(self.interval):
+            if self.changed():
+                self.build()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self.watch, name='StaticIndex', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class Router:
+    """Routes (method, path) to handlers.
+
+    Plain paths are looked up in a dict; paths with {name} parameters are compiled
+    to regular expressions once, when they are registered.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.patterns = []
+
+    def add(self, method, path, handler):
+        if '{' not in path:
+            self.exact[(method, path)] = handler
+            return
+        parts = re.split(r'\{(\w+)\}', path)
+        regex = ''.join(
+            re.escape(part) if i % 2 == 0 else f'(?P<{part}>[^/]+)' for i, part in enumerate(parts)
+        )
+        self.patterns.append((method, re.compile(f'^{regex}$'), handler))
+
+    def route(self, method, path):
+        def decorator(handler):
+            self.add(method, path, handler)
+            return handler
+        return decorator
+
+    def resolve(self, method, path):
+        """Returns (handler, params) or (None, None)."""
+        handler = self.exact.get((method, path))
+        if handler is not None:
+            return handler, {}
+        for route_method, regex, handler in self.patterns:
+            if route_method == method and (match := regex.match(path)):
+                return handler, match.groupdict()
+        return None, None
+
+
+router = Router()
+static_index = None     # створюється в run_http_server, щоб не сканувати диск під час імпорту
 
 
 class MyHWFramework(BaseHTTPRequestHandler):
+    # HTTP/1.1 тримає з'єднання відкритим між запитами, тому кожна відповідь має містити Content-Length
+    protocol_version = 'HTTP/1.1'
+    # стільки чекаємо на наступний запит у keep-alive з'єднанні, перш ніж звільнити потік
+    timeout = KEEP_ALIVE_TIMEOUT
+    # заголовки й тіло йдуть окремими write; з Nagle друге чекало б на delayed ACK клієнта (~40 мс)
+    disable_nagle_algorithm = True
 
     def do_GET(self):
-        route = urllib.parse.urlparse(self.path)
-        match route.path:
-            case '/':
-                self.send_html('index.html')
-            case '/message':
-                self.send_html('message.html')
-            case _:
-                file = BASE_DIR.joinpath(route.path[1:])
-                if file.exists():
-                    self.send_static(file)
-                else:
-                    self.send_html('404.html', status_code=404)
+        self.dispatch('GET')
 
     def do_POST(self):
-        size = self.headers.get('Content-Length')
-        data = self.rfile.read(int(size))
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client_socket.sendto(data, (SOCKET_HOST, SOCKET_PORT))
-        client_socket.close()
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        route = urllib.parse.urlparse(self.path)
+        handler, params = router.resolve(method, route.path)
+        if handler is not None:
+            handler(self, route.query, **params)
+            return
+        if method == 'GET' and static_index is not None:
+            file = static_index.lookup(route.path)
+            if file is not None:
+                self.send_static(file)
+                return
+        if int(self.headers.get('Content-Length', 0)):
+            self.close_connection = True    # непрочитане тіло зіпсувало б наступний запит у з'єднанні
+        self.send_html(NOT_FOUND_PAGE, status_code=404)
+
+    @router.route('GET', '/')
+    def send_index(self, query):
+        self.send_html('index.html')
+
+    @router.route('GET', '/message')
+    def send_message_form(self, query):
+        self.send_html('message.html')
+
+    @router.route('POST', '/message')
+    def receive_message(self, query):
+        size = int(self.headers.get('Content-Length', 0))
+        if size > MAX_MESSAGE_SIZE:
+            self.close_connection = True    # тіло не читаємо, тож з'єднання далі використати не можна
+            self.send_response(413)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = self.rfile.read(size)
+        try:
+            forwarder.send(data)
+        except OSError as error:
+            logging.error(error)
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
         self.send_response(302)
         self.send_header('Location', '/message')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-    def send_html(self, filename, status_code=200):
+    @router.route('GET', '/messages')
+    def send_messages(self, query):
+        params = urllib.parse.parse_qs(query)
+        try:
+            offset = max(int(params.get('offset', ['0'])[0]), 0)
+            limit = min(max(int(params.get('limit', [str(MESSAGES_PAGE_SIZE)])[0]), 0), MESSAGES_MAX_PAGE_SIZE)
+        except ValueError:
+            self.send_json({'error': 'offset and limit must be integers'}, status_code=400)
+            return
+        total, messages = storage.get_index().query(
+            since=params.get('since', [None])[0],
+            until=params.get('until', [None])[0],
+            username=params.get('username', [None])[0],
+            offset=offset,
+            limit=limit,
+        )
+        self.send_json({'total': total, 'offset': offset, 'limit': limit, 'messages': messages})
+
+    def send_json(self, data, status_code=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
         self.send_response(status_code)
-        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
+        self.wfile.write(body)
 
-        with open(filename, 'rb') as file:
-            self.wfile.write(file.read())
+    def send_html(self, filename, status_code=200):
+        self.send_file(filename, 'text/html', status_code)
 
     def send_static(self, filename, status_code=200):
-        self.send_response(status_code)
         mime_type, *_ = mimetypes.guess_type(filename)
-        if mime_type:
-            self.send_header('Content-Type', mime_type)
-        else:
-            self.send_header('Content-type', 'text/plain')
+        self.send_file(filename, mime_type or 'text/plain', status_code)
+
+    def send_file(self, filename, content_type, status_code=200):
+        entry = static_cache.get(filename)
+        encoding = None
+        if is_compressible(content_type):
+            for encoding in self.accepted_encodings():
+                variant = static_cache.encoded(entry, encoding)
+                if variant is not None:
+                    entry = variant
+                    break
+            else:
+                encoding = None
+
+        if status_code == 200 and self.not_modified(entry):
+            self.send_response(304)
+            self.send_header('ETag', entry.etag)
+            self.send_header('Last-Modified', entry.last_modified)
+            if is_compressible(content_type):
+                self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        start, end = 0, entry.size
+        byte_range = self.requested_range(entry) if status_code == 200 else None
+        if byte_range == 'unsatisfiable':
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{entry.size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if is_compressible(content_type):
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(end - start))
+        if status_code == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{entry.size}')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', entry.etag)
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Cache-Control', 'no-cache')   # браузер перепитує, але з If-None-Match
         self.end_headers()
 
+        if entry.body is not None:
+            self.wfile.write(entry.body[start:end])
+        else:
+            self.stream_file(entry.path, start, end - start)
+
+    def accepted_encodings(self):
+        """Encodings from Accept-Encoding that we can serve, best first."""
+        weights = {}
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.partition(';')
+            params = params.strip()
+            try:
+                weights[name.strip().lower()] = float(params[2:]) if params.startswith('q=') else 1.0
+            except ValueError:
+                continue
+        default = weights.get('*', 0)
+        candidates = [encoding for encoding in ENCODINGS if weights.get(encoding, default) > 0]
+        return sorted(candidates, key=lambda encoding: -weights.get(encoding, default))
+
+    def stream_file(self, filename, offset, count):
+        """Sends a part of the file straight from the page cache to the socket, in constant memory."""
         with open(filename, 'rb') as file:
-            self.wfile.write(file.read())
+            try:
+                while count > 0:
+                    sent = os.sendfile(self.connection.fileno(), file.fileno(), offset, min(count, SEND_CHUNK))
+                    if sent == 0:
+                        return
+                    offset += sent
+                    count -= sent
+            except (AttributeError, OSError) as error:
+                # sendfile є не на всіх платформах і не для всіх сокетів; решту дописуємо шматками
+                if isinstance(error, OSError) and error.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK):
+                    raise
+                file.seek(offset)
+                while count > 0 and (chunk := file.read(min(count, SEND_CHUNK))):
+                    self.wfile.write(chunk)
+                    count -= len(chunk)
 
+    def requested_range(self, entry):
+        """Parses a single 'bytes=' range; returns (start, end) with end exclusive, None or 'unsatisfiable'."""
+        header = self.headers.get('Range')
+        if header is None or not header.startswith('bytes=') or ',' in header:
+            return None     # кілька діапазонів не підтримуємо — віддаємо файл повністю
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range not in (entry.etag, entry.last_modified):
+            return None     # файл змінився з моменту, коли клієнт почав завантаження
+        first, _, last = header.removeprefix('bytes=').strip().partition('-')
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last) + 1, entry.size) if last else entry.size
+            else:
+                start, end = max(entry.size - int(last), 0), entry.size
+        except ValueError:
+            return None
+        if start >= entry.size or start >= end:
+            return 'unsatisfiable'
+        return start, end
 
-def save_data_from_message(data):
-    parse_data = urllib.parse.unquote_plus(data.decode())
-    current_datetime = datetime.now().isoformat()
-    try:
-        parse_dict = {key: value for key, value in [el.split('=') for el in parse_data.split('&')]}
+    def not_modified(self, entry):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match має пріоритет над If-Modified-Since
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or entry.etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                return entry.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands connections to a fixed pool of threads instead of serving them one by one."""
+
+    request_queue_size = HTTP_BACKLOG
+
+    def __init__(self, server_address, handler_class, max_workers=HTTP_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='HTTP')
+        # обмежуємо кількість прийнятих, але ще не обслужених з'єднань; решта чекає у backlog ядра
+        self.slots = BoundedSemaphore(max_workers * 4)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class MessageIndex:
+    """In-memory index of messages: timestamps sorted for bisect, plus per-username postings.
+
+    ISO timestamps of one format sort as strings, so no parsing is needed.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.records = {}
+        self.timestamps = []
+        self.by_username = {}
+
+    def add_many(self, records):
+        with self.lock:
+            for timestamp, record in records:
+                old = self.records.get(timestamp)
+                self.records[timestamp] = record
+                if old is None:
+                    self._insert(self.timestamps, timestamp)
+                elif old['username'] != record['username']:
+                    self.by_username[old['username']].remove(timestamp)
+                else:
+                    continue
+                self._insert(self.by_username.setdefault(record['username'], []), timestamp)
+
+    @staticmethod
+    def _insert(timestamps, timestamp):
+        # повідомлення приходять майже завжди в порядку часу, тоді це просто append
+        if not timestamps or timestamps[-1] < timestamp:
+            timestamps.append(timestamp)
+        else:
+            bisect.insort(timestamps, timestamp)
+
+    def query(self, since=None, until=None, username=None, offset=0, limit=MESSAGES_PAGE_SIZE):
+        """Returns (total, page) for messages with since <= timestamp < until, oldest first."""
+        with self.lock:
+            timestamps = self.timestamps if username is None else self.by_username.get(username, [])
+            start = bisect.bisect_left(timestamps, since) if since else 0
+            end = bisect.bisect_left(timestamps, until) if until else len(timestamps)
+            end = max(start, end)
+            page = timestamps[start + offset:min(start + offset + limit, end)]
+            return end - start, [{'timestamp': timestamp, **self.records[timestamp]} for timestamp in page]
+
+
+class MessageStorage:
+    """Append-only storage of messages.
+
+    Every message is one line in a JSON Lines log, so a write costs the same no matter
+    how many messages are stored. Every compact_every messages the log is folded into
+    data.json in the usual {timestamp: {username, message}} format and truncated.
+    """
+
+    def __init__(self, data_path=STORAGE_FILE, log_path=STORAGE_LOG, compact_every=COMPACT_EVERY):
+        self.data_path = Path(data_path)
+        self.log_path = Path(log_path)
+        self.compact_every = compact_every
+        self.lock = Lock()
+        self.log = None
+        self.index = None
+        self.bytes_written = 0  # разом із переписуванням data.json під час ущільнення
+        try:
+            with open(self.log_path, 'rb') as file:
+                self.appended = sum(1 for _ in file)
+        except FileNotFoundError:
+            self.appended = 0
+
+    def append(self, timestamp, record):
+        self.append_many([(timestamp, record)])
 
+    def append_many(self, records):
+        """Writes a batch of (timestamp, record) pairs with a single write and a single fsync."""
+        lines = ''.join(
+            json.dumps({'timestamp': timestamp, **record}, ensure_ascii=False) + '\n' for timestamp, record in records
+        ).encode('utf-8')
+        with self.lock:
+            if self.log is None:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                self.log = open(self.log_path, 'ab')
+            self.log.write(lines)
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.bytes_written += len(lines)
+            self.appended += len(records)
+            if self.index is not None:
+                self.index.add_many(records)
+            if self.appended >= self.compact_every:
+                self._compact()
+
+    def get_index(self):
+        """Builds the index from the files on first use; after that appends keep it up to date."""
+        with self.lock:
+            if self.index is None:
+                index = MessageIndex()
+                index.add_many(self._load().items())
+                self.index = index
+            return self.index
+
+    def load(self):
+        """Returns all messages as one dict: data.json plus everything appended after it."""
+        with self.lock:
+            return self._load()
+
+    def _load(self):
         try:
-            with open('storage/data.json', 'r', encoding='utf-8') as file:
+            with open(self.data_path, 'r', encoding='utf-8') as file:
                 data = json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError) as error:
+        except FileNotFoundError:
+            data = {}
+        except json.JSONDecodeError as error:
             logging.error(error)
             data = {}
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue    # обірваний останній рядок після аварійної зупинки
+                    data[record.pop('timestamp')] = record
+        except FileNotFoundError:
+            pass
+        return data
 
-        data[current_datetime] = {
-            "username": parse_dict.get('username', ''),
-            "message": parse_dict.get('message', '')
-        }
-        with open('storage/data.json', 'w', encoding='utf-8') as file:
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        data = self._load()
+        tmp_path = self.data_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
             json.dump(data, file, ensure_ascii=False, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+            self.bytes_written += os.fstat(file.fileno()).st_size
+        # якщо впадемо між replace і очищенням журналу, повторне застосування журналу нічого не зіпсує
+        os.replace(tmp_path, self.data_path)
+        if self.log is not None:
+            self.log.close()
+        self.log = open(self.log_path, 'wb')
+        self.appended = 0
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+
+storage = MessageStorage()
+
+
+def parse_message(data):
+    parse_data = urllib.parse.unquote_plus(data.decode())
+    parse_dict = {key: value for key, value in [el.split('=') for el in parse_data.split('&')]}
+    return {
+        "username": parse_dict.get('username', ''),
+        "message": parse_dict.get('message', '')
+    }
+
+
+def save_data_from_message(data):
+    current_datetime = datetime.now().isoformat()
+    try:
+        storage.append(current_datetime, parse_message(data))
     except ValueError as error:
         logging.error(error)
     except OSError as error:
         logging.error(error)
 
 
+class MessageWriter:
+    """Persists received messages in a background thread.
+
+    The socket loop only puts raw datagrams into a bounded queue; the writer takes them
+    out in batches of up to batch_size messages or batch_delay seconds and commits each
+    batch to the storage with one fsync. When the queue is full new messages are dropped;
+    messages that cannot be parsed or written are counted as dropped too.
+    """
+
+    STOP = None
+
+    def __init__(self, storage, queue_size=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE,
+                 batch_delay=WRITE_BATCH_DELAY):
+        self.storage = storage
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.lock = Lock()
+        self.received = 0
+        self.persisted = 0
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run, name='MessageWriter', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(self.STOP)   # усе, що вже в черзі, буде записано перед зупинкою
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, data):
+        with self.lock:
+            self.received += 1
+        try:
+            # час фіксуємо під час отримання, а не запису
+            self.queue.put_nowait((datetime.now().isoformat(), data))
+        except Full:
+            with self.lock:
+                self.dropped += 1
+
+    def counters(self):
+        with self.lock:
+            return {'received': self.received, 'persisted': self.persisted, 'dropped': self.dropped}
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self.STOP:
+                return
+            batch = [item]
+            deadline = monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - monotonic()))
+                except Empty:
+                    break
+                if item is self.STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.commit(batch)
+
+    def commit(self, batch):
+        records = []
+        invalid = 0
+        for timestamp, data in batch:
+            try:
+                records.append((timestamp, parse_message(data)))
+            except ValueError as error:
+                logging.error(error)
+                invalid += 1
+        try:
+            if records:
+                self.storage.append_many(records)
+        except OSError as error:
+            logging.error(error)
+            invalid += len(records)
+            records = []
+        with self.lock:
+            self.persisted += len(records)
+            self.dropped += invalid
+
+
+message_writer = MessageWriter(storage)
+
+
 def run_http_server(host, port):
+    global static_index
+    static_index = StaticIndex()
+    static_index.start()
     address = (host, port)
-    http_server = HTTPServer(address, MyHWFramework)
+    http_server = PooledHTTPServer(address, MyHWFramework)
     logging.info("Starting http server")
     try:
         http_server.serve_forever()
@@ -99,23 +832,30 @@ def run_http_server(host, port):
         pass
     finally:
         http_server.server_close()
+        static_index.stop()
+        forwarder.close()
         logging.info("Stopping http server")
 
 
 def run_socket_server(host, port):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # більший буфер ядра переживає сплески, поки потік запису скидає пачку на диск
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECEIVE_BUFFER)
     server_socket.bind((host, port))
+    message_writer.start()
     logging.info("Starting socket server")
     try:
         while True:
             msg, address = server_socket.recvfrom(BUFFER_SIZE)
-            logging.info(f"Socket received {address}: {msg}")
-            save_data_from_message(msg)
+            logging.debug(f"Socket received {address}: {msg}")
+            message_writer.submit(msg)
     except KeyboardInterrupt:
         pass
     finally:
         server_socket.close()
-        logging.info("Stopping socket server")
+        message_writer.stop()
+        storage.close()
+        logging.info(f"Stopping socket server: {message_writer.counters()}")
 
 
 if __name__ == "__main__":
@@ -1,62 +1,294 @@
 import aiohttp
+import argparse
 import asyncio
 import json
+import os
 import platform
+import random
+import sqlite3
 import sys
 
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from time import time
+
+MAX_CONCURRENT_REQUESTS = 11     # 0..10 днів — усі запити за один раунд
+# адресу можна підмінити локальною заглушкою, а EXCHANGE_OFFLINE=1 бере курси лише з кешу
+API_URL = os.environ.get("PRIVAT_API_URL", "https://api.privatbank.ua/p24api/exchange_rates")
+CACHE_FILE = os.environ.get("EXCHANGE_CACHE", str(Path(__file__).with_name("rates_cache.sqlite")))
+OFFLINE = os.environ.get("EXCHANGE_OFFLINE") == "1"
+TODAY_TTL = 60 * 60
+REQUEST_TIMEOUT = 30
+RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d")
 
 
 class HttpError(Exception):
     pass
 
 
-async def request(url: str):
-    async with aiohttp.ClientSession() as session:
+class TransientHttpError(HttpError):
+    """An error worth retrying: lost connection, timeout, 429 or 5xx."""
+
+    def __init__(self, *args, retry_after: float | None = None):
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Limits concurrent requests and, optionally, requests per second.
+
+    After a 429 the whole limiter is paused, so the other requests wait as well
+    instead of hitting the limit again.
+    """
+
+    def __init__(self, concurrency: int, rate: float = 0):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0
+        self.paused_until = 0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_slot, self.paused_until)
+        self.next_slot = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, asyncio.get_running_loop().time() + seconds)
+
+
+class RatesCache:
+    """Cache of API responses by date: SQLite on disk with an in-memory LRU in front.
+
+    Rates for past dates never change and are kept forever; today's rates expire
+    after today_ttl seconds because the bank can still publish or update them.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, maxsize: int = 1024, today_ttl: float = TODAY_TTL):
+        self.maxsize = maxsize
+        self.today_ttl = today_ttl
+        self.items = OrderedDict()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rates (day TEXT PRIMARY KEY, response TEXT, fetched_at REAL)"
+        )
+
+    def get(self, day: date, allow_stale: bool = False) -> dict | None:
+        key = day.isoformat()
+        if key in self.items:
+            self.items.move_to_end(key)
+            response, fetched_at = self.items[key]
+        else:
+            row = self.connection.execute("SELECT response, fetched_at FROM rates WHERE day = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, fetched_at = json.loads(row[0]), row[1]
+            self._remember(key, response, fetched_at)
+        if not allow_stale and day >= date.today() and time() - fetched_at > self.today_ttl:
+            return None
+        return response
+
+    def put(self, day: date, response: dict) -> None:
+        key = day.isoformat()
+        fetched_at = time()
+        self._remember(key, response, fetched_at)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO rates (day, response, fetched_at) VALUES (?, ?, ?)",
+            (key, json.dumps(response, ensure_ascii=False), fetched_at),
+        )
+        self.connection.commit()
+
+    def _remember(self, key: str, response: dict, fetched_at: float) -> None:
+        self.items[key] = (response, fetched_at)
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    try:
+        return max(float(value), 0) if value is not None else None
+    except ValueError:
+        return None     # дату в Retry-After не розбираємо, тоді діє звичайна затримка
+
+
+async def request(session: aiohttp.ClientSession, url: str):
+    try:
+        async with session.get(url) as resp:
+            if resp.status == 200:
+                result = await resp.json()
+                return result
+            elif resp.status in RETRY_STATUSES:
+                raise TransientHttpError(f"Error status: {resp.status} for {url}",
+                                         retry_after=parse_retry_after(resp.headers.get("Retry-After")))
+            else:
+                raise HttpError(f"Error status: {resp.status} for {url}")
+    except aiohttp.InvalidURL as err:
+        raise HttpError(f"Connection error: {url}", str(err))
+    except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as err:
+        raise TransientHttpError(f"Connection error: {url}", str(err))
+
+
+async def request_with_retry(session: aiohttp.ClientSession, limiter: RateLimiter, url: str, retries: int = RETRIES):
+    for attempt in range(retries + 1):
         try:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    return result
-                else:
-                    raise HttpError(f"Error status: {resp.status} for {url}")
-        except (aiohttp.ClientConnectorError, aiohttp.InvalidURL) as err:
-            raise HttpError(f"Connection error: {url}", str(err))
+            async with limiter:
+                return await request(session, url)
+        except TransientHttpError as err:
+            if attempt == retries:
+                raise
+            # експоненційна затримка з повним джитером, щоб повтори не йшли хвилею
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if err.retry_after is not None:
+                limiter.pause(err.retry_after)
+                delay = max(delay, err.retry_after)
+            await asyncio.sleep(delay)
+
+
+async def get_rates(session: aiohttp.ClientSession, limiter: RateLimiter, cache: RatesCache, day: date):
+    response = cache.get(day, allow_stale=OFFLINE)
+    if response is not None:
+        return response
+    format_date = day.strftime("%d.%m.%Y")
+    if OFFLINE:
+        raise HttpError(f"No cached rates for {format_date} in offline mode")
+    url = f"{API_URL}?date={format_date}"
+    response = await request_with_retry(session, limiter, url)
+    if response.get("exchangeRate"):    # порожню відповідь не кешуємо: курси ще можуть з'явитися
+        cache.put(day, response)
+    return response
+
+
+async def get_day(session: aiohttp.ClientSession, limiter: RateLimiter, cache: RatesCache, day: date, x=None):
+    response = await get_rates(session, limiter, cache, day)
+    currency = {"EUR", "USD", x}
+    cur_dict = {}
+    for i in response["exchangeRate"]:
+        if i["currency"] in currency:
+            cur_dict[i["currency"]] = {"sale": i.get("saleRateNB"), "purchase": i.get("purchaseRateNB")}
+    return {response["date"]: cur_dict}
+
+
+def open_session(concurrency: int) -> aiohttp.ClientSession:
+    # одна сесія на всі дні: з'єднання з API перевикористовуються
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency),
+                                 timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
 
 
 async def main(days: int, x=None):
+    limiter = RateLimiter(MAX_CONCURRENT_REQUESTS)
+    cache = RatesCache()
     try:
-        info = []
-        for d in range(0, days + 1):
-            delta = timedelta(days=d)
-            date = datetime.now() - delta
-            format_date = date.strftime("%d.%m.%Y")
-            url = f"https://api.privatbank.ua/p24api/exchange_rates?date={format_date}"
-            response = await request(url)
-            currency = {"EUR", "USD", x}
-            cur_dict = {}
-            for i in response["exchangeRate"]:
-                if i["currency"] in currency:
-                    cur_dict[i["currency"]] = {"sale": i.get("saleRateNB"), "purchase": i.get("purchaseRateNB")}
-            info.append({response["date"]: cur_dict})
-        return info
+        async with open_session(MAX_CONCURRENT_REQUESTS) as session:
+            today = datetime.now().date()
+            tasks = [get_day(session, limiter, cache, today - timedelta(days=d), x) for d in range(0, days + 1)]
+            # gather повертає результати в порядку задач, тож дні йдуть так само, як і раніше
+            return list(await asyncio.gather(*tasks))
     except HttpError as err:
         print(err)
         return None
+    finally:
+        cache.close()
+
+
+async def stream_range(start: date, end: date, x=None, concurrency: int = MAX_CONCURRENT_REQUESTS, rate: float = 0):
+    """Yields {date: rates} for every day from end back to start as soon as each one arrives.
+
+    Only `concurrency` days are in flight at a time, so memory does not depend on the
+    length of the range. A day that still fails after all retries is yielded as
+    {"date": ..., "error": ...} and the rest of the range goes on.
+    """
+    limiter = RateLimiter(concurrency, rate)
+    cache = RatesCache()
+    days = (end - timedelta(days=d) for d in range((end - start).days + 1))
+    results = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker(session: aiohttp.ClientSession):
+        # генератор днів спільний: кожен воркер бере наступний вільний день
+        for day in days:
+            try:
+                result = await get_day(session, limiter, cache, day, x)
+            except HttpError as err:
+                result = {"date": day.strftime("%d.%m.%Y"), "error": " ".join(map(str, err.args))}
+            await results.put(result)
+
+    try:
+        async with open_session(concurrency) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+            finished = asyncio.gather(*workers)
+            finished.add_done_callback(lambda _: results.put_nowait(None))
+            try:
+                while (result := await results.get()) is not None:
+                    yield result
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        cache.close()
+
+
+async def print_range(start: date, end: date, x=None, concurrency: int = MAX_CONCURRENT_REQUESTS,
+                      rate: float = 0) -> int:
+    failed = 0
+    async for result in stream_range(start, end, x, concurrency, rate):
+        failed += "error" in result
+        print(json.dumps(result, ensure_ascii=False), flush=True)   # NDJSON: один день — один рядок
+    return failed
+
+
+def parse_date(value: str) -> date:
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"Unknown date format: {value}, use dd.mm.yyyy or yyyy-mm-dd")
 
 
 if __name__ == "__main__":
     if platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    if len(sys.argv) > 1:
-        index = int(sys.argv[1])
-        if 0 <= index <= 10:
-            if len(sys.argv) > 2:
-                a = asyncio.run(main(days=index, x=sys.argv[2]))
-            else:
-                a = asyncio.run(main(days=index))
+
+    parser = argparse.ArgumentParser(description="PrivatBank exchange rates for the last days or a date range")
+    parser.add_argument("days", help="Number of days back from today", type=int, nargs="?")
+    parser.add_argument("currency", help="Extra currency besides EUR and USD", nargs="?")
+    parser.add_argument("--from", dest="start", help="First day of the range", type=parse_date)
+    parser.add_argument("--to", dest="end", help="Last day of the range, default = today", type=parse_date)
+    parser.add_argument("--currency", "-x", dest="extra", help="Extra currency, the same as the positional one")
+    parser.add_argument("--concurrency", "-c", help="Requests in flight", type=int, default=MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--rate", help="Max requests per second, 0 = no limit", type=float, default=0)
+    args = parser.parse_args()
+
+    args.currency = args.extra or args.currency
+    today = datetime.now().date()
+    if args.start is not None or args.end is not None or (args.days is not None and args.days > 10):
+        # діапазонний режим: результати друкуються як NDJSON по мірі надходження
+        end = args.end or today
+        start = args.start or (end - timedelta(days=args.days or 0))
+        if start > end:
+            print(f"The start of the range ({start}) is after its end ({end}).")
+            sys.exit(2)
+        failed = asyncio.run(print_range(start, end, args.currency, max(1, args.concurrency), max(0, args.rate)))
+        sys.exit(1 if failed else 0)
+    elif args.days is not None:
+        if args.days >= 0:
+            a = asyncio.run(main(days=args.days, x=args.currency))
             print(json.dumps(a, indent=2))
         else:
-            print(f"The entered value ({sys.argv[1]}) does not belong to the range from 0 to 10 inclusive.")
+            print(f"The entered value ({args.days}) must not be negative.")
     else:
         print("Please enter the number of days as an argument.")
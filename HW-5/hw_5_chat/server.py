@@ -1,6 +1,8 @@
 import asyncio
 import logging
+import sys
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import aiohttp
 import names
@@ -10,9 +12,14 @@ from aiopath import AsyncPath
 from websockets import WebSocketServerProtocol
 from websockets.exceptions import ConnectionClosedOK
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from hw_5 import API_URL, RatesCache  # noqa: E402  спільний з hw_5.py кеш курсів
+
 
 logging.basicConfig(level=logging.INFO)
 
+rates_cache = RatesCache()
+
 
 class HttpError(Exception):
     pass
@@ -47,9 +54,13 @@ async def get_exchange(index: int = 0):
         for d in range(0, index + 1):
             delta = timedelta(days=d)
             date = datetime.now() - delta
-            format_date = date.strftime("%d.%m.%Y")
-            url = f"https://api.privatbank.ua/p24api/exchange_rates?date={format_date}"
-            response = await request(url)
+            response = rates_cache.get(date.date())
+            if response is None:
+                format_date = date.strftime("%d.%m.%Y")
+                url = f"{API_URL}?date={format_date}"
+                response = await request(url)
+                if response.get("exchangeRate"):
+                    rates_cache.put(date.date(), response)
             currency = {"EUR", "USD"}
             cur_dict = {}
             for i in response["exchangeRate"]: